@@ -0,0 +1,62 @@
+import os
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_manager.settings')
+django.setup()
+
+import sys
+import time
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from tasks.models import Task, TaskDependency
+from tasks.rendering import dumps, orjson, task_rows
+from tasks.serializers import TaskSerializer
+
+def serializer_path():
+    """What TaskListView.get did before the fast path: TaskSerializer + JSONRenderer."""
+    tasks = Task.objects.order_by('id')
+    return JSONRenderer().render(TaskSerializer(tasks, many=True).data)
+
+def fast_path():
+    return dumps(task_rows(Task.objects.order_by('id')))
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def run_benchmark(task_count=2000, repeat=5):
+    # Everything runs inside a transaction that is rolled back at the end,
+    # so the benchmark never leaves data behind.
+    with transaction.atomic():
+        print(f"Creating {task_count} tasks with chained dependencies...")
+        tasks = Task.objects.bulk_create(
+            Task(title=f"Task {i}", description="Benchmark task") for i in range(task_count)
+        )
+        TaskDependency.objects.bulk_create(
+            TaskDependency(task=tasks[i], depends_on=tasks[i - step])
+            for i in range(task_count)
+            for step in (1, 2, 3)
+            if i - step >= 0
+        )
+
+        expected = serializer_path()
+        if fast_path() != expected:
+            print("ERROR: fast path output differs from TaskSerializer output!")
+            sys.exit(1)
+        print(f"Outputs are byte-identical ({len(expected)} bytes).")
+
+        baseline = best_of(serializer_path, repeat)
+        fast = best_of(fast_path, repeat)
+        encoder = 'orjson' if orjson is not None else 'JSONRenderer'
+        print(f"{'TaskSerializer + JSONRenderer:':<32}{baseline * 1000:8.1f} ms")
+        print(f"{f'Fast path ({encoder}):':<32}{fast * 1000:8.1f} ms")
+        print(f"Speedup: {baseline / fast:.1f}x")
+
+        transaction.set_rollback(True)
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
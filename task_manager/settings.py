@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
@@ -53,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tasks.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'task_manager.urls'
@@ -134,6 +136,22 @@ if not DEBUG:
 CORS_ALLOW_ALL_ORIGINS = True # For now, allow all. In production, consider restricting this.
 # CSRF_TRUSTED_ORIGINS = ['https://YOUR_FRONTEND_URL.vercel.app'] # Add this manually later
 
+# Shared dependency graph snapshot (memory-mapped by every worker on the host)
+TASK_GRAPH_SNAPSHOT_DIR = os.environ.get(
+    'TASK_GRAPH_SNAPSHOT_DIR',
+    os.path.join(tempfile.gettempdir(), 'task_graph_snapshots'),
+)
+
+# Opt-in request profiling (see tasks/profiling.py). Disabled unless a token or
+# a sample rate is set; requests sending `X-Profile: <token>` are profiled.
+TASK_PROFILING_TOKEN = os.environ.get('TASK_PROFILING_TOKEN')
+TASK_PROFILING_SAMPLE_RATE = float(os.environ.get('TASK_PROFILING_SAMPLE_RATE', '0'))
+TASK_PROFILING_MAX_FILES = int(os.environ.get('TASK_PROFILING_MAX_FILES', '200'))
+TASK_PROFILING_DIR = os.environ.get(
+    'TASK_PROFILING_DIR',
+    os.path.join(tempfile.gettempdir(), 'task_profiles'),
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.models import Project
+from tasks.services import archive_completed_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves completed tasks with no open dependents into the archive tables. "
+        "Safe to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Number of tasks moved per transaction (default: 500).",
+        )
+        parser.add_argument(
+            '--project',
+            type=int,
+            help="Only archive tasks of this project id.",
+        )
+
+    def handle(self, *args, **options):
+        project = None
+        if options['project'] is not None:
+            try:
+                project = Project.objects.get(id=options['project'])
+            except Project.DoesNotExist:
+                raise CommandError(f"Project {options['project']} does not exist")
+
+        archived = archive_completed_tasks(batch_size=options['batch_size'], project=project)
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} task(s)"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tasks.models import Project
+from tasks.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Builds the shared dependency graph snapshots (one per project) so workers start warm."
+
+    def handle(self, *args, **options):
+        project_ids = [None] + list(Project.objects.values_list('id', flat=True))
+        for project_id in project_ids:
+            snapshot = build_snapshot(project_id, force=True)
+            self.stdout.write(self.style.SUCCESS(f"Graph snapshot written to {snapshot.path}"))
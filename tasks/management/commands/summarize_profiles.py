@@ -0,0 +1,55 @@
+import json
+import pstats
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from tasks.profiling import list_profiles, profiling_dir
+
+
+class Command(BaseCommand):
+    help = "Summarizes the top functions across request profiles captured by ProfilingMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help="Profile directory (default: TASK_PROFILING_DIR).")
+        parser.add_argument('--endpoint', default=None, help="Only include captures of this view name.")
+        parser.add_argument('--limit', type=int, default=25, help="Number of functions to show (default: 25).")
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            choices=['cumulative', 'tottime', 'ncalls'],
+            help="Sort key for the function table (default: cumulative).",
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or profiling_dir()
+        captures = []
+        for path in list_profiles(directory):
+            try:
+                with open(path[:-len('.prof')] + '.json') as meta_file:
+                    meta = json.load(meta_file)
+            except (FileNotFoundError, ValueError):
+                meta = {'endpoint': 'unknown'}
+            if options['endpoint'] and meta.get('endpoint') != options['endpoint']:
+                continue
+            captures.append((path, meta))
+
+        if not captures:
+            self.stdout.write(f"No profiles found in {directory}")
+            return
+
+        by_endpoint = defaultdict(list)
+        for _, meta in captures:
+            by_endpoint[meta.get('endpoint')].append(meta)
+
+        self.stdout.write(f"{len(captures)} profile(s) in {directory}\n")
+        self.stdout.write(f"{'endpoint':<40} {'n':>5} {'avg ms':>10} {'avg queries':>12} {'max graph':>10}")
+        for endpoint, metas in sorted(by_endpoint.items(), key=lambda item: -len(item[1])):
+            avg_ms = sum(meta.get('duration_ms', 0) for meta in metas) / len(metas)
+            avg_queries = sum(meta.get('query_count', 0) for meta in metas) / len(metas)
+            max_graph = max((meta.get('graph_size') or 0) for meta in metas)
+            self.stdout.write(f"{str(endpoint):<40} {len(metas):>5} {avg_ms:>10.1f} {avg_queries:>12.1f} {max_graph:>10}")
+        self.stdout.write('')
+
+        stats = pstats.Stats(*[path for path, _ in captures], stream=self.stdout)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
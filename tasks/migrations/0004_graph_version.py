@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-19 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_project'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphVersion',
+            fields=[
+                ('partition', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('generation', models.BigIntegerField()),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taskdependency',
+            index=models.Index(fields=['project', 'id'], name='tasks_taskd_project_93f2e5_idx'),
+        ),
+    ]
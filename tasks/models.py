@@ -1,6 +1,19 @@
-from django.db import models
+import secrets
+
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 
+class Project(models.Model):
+    """
+    A board of tasks. Each project is its own dependency graph: edges never
+    cross projects, so graph work is always scoped to a single project.
+    """
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -9,18 +22,71 @@ class Task(models.Model):
         ('blocked', 'Blocked'),
     ]
 
+    project = models.ForeignKey(Project, related_name='tasks', on_delete=models.CASCADE, null=True, blank=True)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'status']),
+        ]
+
     def __str__(self):
         return self.title
 
+class GraphVersion(models.Model):
+    """
+    Version of one project's dependency graph, kept in the same database as the graph.
+
+    Every edge write bumps the row inside its own transaction. Besides telling
+    shared graph snapshots (see `tasks/snapshot.py`) whether they can be
+    trusted, the row lock serializes edge writes per project, so a cycle check
+    made under it sees every committed edge and edge ids grow in commit order.
+
+    `partition` is the project id, or 0 for tasks without a project. The random
+    `generation` is picked when the row is created, so after a flush or on a
+    fresh database no old snapshot can match.
+    """
+    partition = models.BigIntegerField(primary_key=True)
+    generation = models.BigIntegerField()
+    version = models.BigIntegerField(default=0)
+
+    @classmethod
+    def _get_or_create(cls, project_id):
+        return cls.objects.get_or_create(
+            partition=project_id or 0,
+            defaults={'generation': secrets.randbits(62)},
+        )
+
+    @classmethod
+    def current(cls, project_id=None):
+        """Returns (generation, version) of a project's graph."""
+        row = cls.objects.filter(partition=project_id or 0).values_list('generation', 'version').first()
+        if row is None:
+            version, _ = cls._get_or_create(project_id)
+            row = (version.generation, version.version)
+        return row
+
+    @classmethod
+    def bump(cls, project_id=None):
+        """Advances a project's graph version; call it inside the writing transaction."""
+        bump = {'version': models.F('version') + 1}
+        if not cls.objects.filter(partition=project_id or 0).update(**bump):
+            cls._get_or_create(project_id)
+            cls.objects.filter(partition=project_id or 0).update(**bump)
+
+    def __str__(self):
+        return f"graph {self.partition} v{self.version}"
+
 class TaskDependency(models.Model):
     task = models.ForeignKey(Task, related_name='dependencies', on_delete=models.CASCADE)
     depends_on = models.ForeignKey(Task, related_name='dependents', on_delete=models.CASCADE)
+    # Copied from `task` on save so per-project graph scans can use an index
+    # that leads with the project.
+    project = models.ForeignKey(Project, related_name='+', on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -29,42 +95,70 @@ class TaskDependency(models.Model):
         ]
         indexes = [
             models.Index(fields=['task', 'depends_on']),
+            models.Index(fields=['project', 'task']),
+            models.Index(fields=['project', 'id']),
         ]
 
     def clean(self):
         if self.task == self.depends_on:
             raise ValidationError("A task cannot depend on itself.")
-        
-        # Check for circular dependency
-        # This is a simple recursive check. For very large graphs, this might be slow,
-        # but for typical task lists it's acceptable.
-        if self.task_id and self.depends_on_id:
-             if self.check_circular(self.depends_on, self.task):
-                raise ValidationError(f"Circular dependency detected: {self.task} -> ... -> {self.depends_on} -> {self.task}")
 
-    def check_circular(self, current_task, target_task, visited=None):
-        if visited is None:
-            visited = set()
-        
-        if current_task == target_task:
-            return True
-        
-        visited.add(current_task)
+        if self.task.project_id != self.depends_on.project_id:
+            raise ValidationError("A task cannot depend on a task from another project.")
         
-        # We need to look at what 'current_task' depends on.
-        # current_task.dependencies gives us TaskDependency objects where task=current_task.
-        # We want the 'depends_on' field of those objects.
-        for dependency in current_task.dependencies.all():
-            next_task = dependency.depends_on
-            if next_task in visited:
-                continue
-            if self.check_circular(next_task, target_task, visited):
-                return True
-        return False
+        # Check for circular dependency using the shared graph snapshot, so
+        # the walk costs no queries per visited task.
+        if self.task_id and self.depends_on_id:
+            from .services import detect_cycle
+            is_circular, path = detect_cycle(self.task_id, self.depends_on_id, self.task.project_id)
+            if is_circular:
+                raise ValidationError(
+                    f"Circular dependency detected: {self.task} -> ... -> {self.depends_on} -> {self.task}",
+                    code='circular',
+                    params={'path': path},
+                )
 
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Lock the project's graph first, so the cycle check and the insert
+            # cannot interleave with another edge write to the same project.
+            GraphVersion.bump(self.task.project_id)
+            self.clean()
+            self.project_id = self.task.project_id
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.task.title} depends on {self.depends_on.title}"
+
+class ArchivedTask(models.Model):
+    """
+    A completed task moved out of the hot `Task` table by the archive job.
+
+    Rows keep the original task id, so archived history and live tasks can be
+    cross-referenced. Archived tasks are read-only.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    project_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES, default='completed')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+class ArchivedTaskDependency(models.Model):
+    """
+    A dependency edge that touched an archived task.
+
+    Plain ids are stored instead of foreign keys because either side may be an
+    archived task or a (completed) task that is still live.
+    """
+    task_id = models.BigIntegerField(db_index=True)
+    depends_on_id = models.BigIntegerField(db_index=True)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.task_id} depends on {self.depends_on_id}"
@@ -0,0 +1,151 @@
+"""
+Opt-in per-request profiling for production traffic.
+
+A request is profiled with cProfile when it carries the protected
+`X-Profile: <TASK_PROFILING_TOKEN>` header, or when it is picked by
+`TASK_PROFILING_SAMPLE_RATE`. Each capture is written to
+`TASK_PROFILING_DIR` as a `.prof` file (pstats format) plus a `.json` sidecar
+with the endpoint, status, duration, query count and graph size. Only the
+newest `TASK_PROFILING_MAX_FILES` captures are kept.
+
+Use `python manage.py summarize_profiles` to aggregate the captures.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .models import Task
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+logger = logging.getLogger(__name__)
+
+
+def profiling_dir():
+    return getattr(
+        settings,
+        'TASK_PROFILING_DIR',
+        os.path.join(tempfile.gettempdir(), 'task_profiles'),
+    )
+
+
+def list_profiles(directory=None):
+    """Returns the captured `.prof` files, oldest first."""
+    directory = directory or profiling_dir()
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.prof')]
+    except FileNotFoundError:
+        return []
+    # Names start with a nanosecond timestamp, so they sort chronologically.
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def graph_size(project_id=None):
+    """Number of live tasks in the profiled project (or overall), None if unknown."""
+    try:
+        tasks = Task.objects.all()
+        if project_id is not None:
+            tasks = tasks.filter(project_id=project_id or None)
+        return tasks.count()
+    except ValueError:
+        return None
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.token = getattr(settings, 'TASK_PROFILING_TOKEN', None)
+        self.sample_rate = getattr(settings, 'TASK_PROFILING_SAMPLE_RATE', 0.0)
+        self.max_files = getattr(settings, 'TASK_PROFILING_MAX_FILES', 200)
+        # Not configured: drop out of the middleware chain entirely.
+        if not self.token and self.sample_rate <= 0:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        # A capture that cannot be written must not fail the request.
+        try:
+            self.save(request, response, profiler, duration_ms, query_count)
+        except Exception:
+            logger.exception("Could not save profile for %s", request.path)
+        return response
+
+    def should_profile(self, request):
+        header = request.META.get(PROFILE_HEADER)
+        if self.token and header and self.token_matches(header):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def token_matches(self, header):
+        # compare_digest only accepts ASCII strings, so compare bytes. WSGI
+        # decodes header values as latin-1, which turns them back into the raw bytes.
+        try:
+            header = header.encode('latin-1')
+        except UnicodeEncodeError:
+            return False
+        return hmac.compare_digest(header, self.token.encode())
+
+    def save(self, request, response, profiler, duration_ms, query_count):
+        match = request.resolver_match
+        endpoint = match.view_name if match else request.path
+        project_id = request.GET.get('project')
+
+        meta = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'project': project_id,
+            'status_code': response.status_code,
+            'duration_ms': round(duration_ms, 3),
+            'query_count': query_count,
+            'graph_size': graph_size(project_id),
+        }
+
+        directory = profiling_dir()
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', endpoint).strip('_') or 'root'
+        base = os.path.join(directory, f'{time.time_ns()}-{os.getpid()}-{slug}')
+
+        profiler.dump_stats(base + '.prof')
+        with open(base + '.json', 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        self.rotate(directory)
+
+    def rotate(self, directory):
+        profiles = list_profiles(directory)
+        for path in profiles[:max(len(profiles) - self.max_files, 0)]:
+            for stale in (path, path[:-len('.prof')] + '.json'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
@@ -1,5 +1,7 @@
+from collections import defaultdict
+
 from rest_framework import serializers
-from .models import Task, TaskDependency
+from .models import ArchivedTask, ArchivedTaskDependency, Project, Task, TaskDependency
 
 class TaskSerializer(serializers.ModelSerializer):
     dependencies = serializers.SerializerMethodField()
@@ -11,5 +13,64 @@ class TaskSerializer(serializers.ModelSerializer):
     def get_dependencies(self, obj):
         return list(obj.dependencies.values_list('depends_on_id', flat=True))
 
+    def validate_project(self, value):
+        # Moving a task that is wired into its project's graph would leave
+        # cross-project edges behind.
+        task = self.instance
+        if task is not None and task.project_id != (value.id if value else None):
+            if task.dependencies.exists() or task.dependents.exists():
+                raise serializers.ValidationError(
+                    "Cannot move a task with dependencies to another project."
+                )
+        return value
+
+class ProjectSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Project
+        fields = '__all__'
+
 class TaskDependencySerializer(serializers.Serializer):
     depends_on_id = serializers.IntegerField()
+
+class DependencyEdgeSerializer(serializers.Serializer):
+    task_id = serializers.IntegerField()
+    depends_on_id = serializers.IntegerField()
+
+class BulkDependencyRemovalSerializer(serializers.Serializer):
+    MAX_DEPENDENCIES = 1000
+
+    dependencies = DependencyEdgeSerializer(many=True, allow_empty=False, max_length=MAX_DEPENDENCIES)
+
+class ArchivedTaskSerializer(serializers.ModelSerializer):
+    dependencies = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedTask
+        fields = '__all__'
+        read_only_fields = [field.name for field in ArchivedTask._meta.fields]
+
+    def get_dependencies(self, obj):
+        # Listings pass every row's dependency ids in the context (see
+        # `archived_dependency_ids`) so they are not fetched one row at a time.
+        dependency_ids = self.context.get('dependency_ids')
+        if dependency_ids is not None:
+            return dependency_ids.get(obj.id, [])
+        return list(
+            ArchivedTaskDependency.objects
+            .filter(task_id=obj.id)
+            .order_by('id')
+            .values_list('depends_on_id', flat=True)
+        )
+
+def archived_dependency_ids(queryset):
+    """Maps archived task id -> dependency ids for every task in `queryset`, in one query."""
+    dependency_ids = defaultdict(list)
+    edges = (
+        ArchivedTaskDependency.objects
+        .filter(task_id__in=queryset.order_by().values('id'))
+        .order_by('id')
+        .values_list('task_id', 'depends_on_id')
+    )
+    for task_id, depends_on_id in edges:
+        dependency_ids[task_id].append(depends_on_id)
+    return dependency_ids
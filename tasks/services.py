@@ -1,12 +1,25 @@
-from .models import Task
+from collections import defaultdict
 
-def detect_cycle(source_task_id, target_task_id):
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import ArchivedTask, ArchivedTaskDependency, Task, TaskDependency
+from .signals import snapshot_updates_suspended
+from .snapshot import load_graph, record_removed_edges
+
+# Tasks matched per query when removing dependencies in bulk.
+REMOVAL_CHUNK_SIZE = 100
+
+def detect_cycle(source_task_id, target_task_id, project_id=None):
     """
     Detects if adding a dependency (source_task -> target_task) creates a cycle using DFS.
 
+    Only the project's own graph is searched, since edges never cross projects.
+
     Args:
         source_task_id (int): The ID of the task that will depend on the target.
         target_task_id (int): The ID of the task being depended upon.
+        project_id (int | None): The project both tasks belong to.
 
     Returns:
         tuple: (is_circular (bool), path (list[int]))
@@ -19,45 +32,58 @@ def detect_cycle(source_task_id, target_task_id):
     # We want to check if there is a path from target_task back to source_task.
     # If target_task -> ... -> source_task exists, then adding source_task -> target_task
     # closes the loop.
-    
-    # DFS Initialization
+    path = _find_path(load_graph(project_id), target_task_id, source_task_id)
+
+    # The snapshot may still hold an edge that was removed where this host
+    # could not see it, so a cycle is only reported once the database confirms it.
+    if path and not _edges_exist(path, project_id):
+        path = _find_path(load_graph(project_id, rebuild=True), target_task_id, source_task_id)
+
+    if path:
+        # The full cycle including the proposed edge is source -> target -> ... -> source
+        return True, [source_task_id] + path
+    return False, []
+
+def _find_path(graph, start_id, goal_id):
+    """Returns a path of task ids from start to goal using DFS, or None."""
     visited = set()
-    stack = [(target_task_id, [target_task_id])] # (current_id, path_so_far)
+    stack = [(start_id, [start_id])] # (current_id, path_so_far)
 
     while stack:
         current_id, path = stack.pop()
         
-        if current_id == source_task_id:
-            # Cycle found!
-            # The path is target -> ... -> source.
-            # The full cycle including the proposed edge is source -> target -> ... -> source
-            full_path = [source_task_id] + path
-            return True, full_path
+        if current_id == goal_id:
+            return path
 
         if current_id in visited:
             continue
         visited.add(current_id)
 
-        try:
-            current_task = Task.objects.get(id=current_id)
-            # Find all tasks that 'current_task' depends on.
-            # current_task.dependencies gives TaskDependency objects where task=current_task
-            dependencies = current_task.dependencies.all()
-            
-            for dep in dependencies:
-                next_id = dep.depends_on_id
-                if next_id not in visited: # Optimization: don't revisit nodes in this search
-                    # However, strictly for finding *any* path to source, strict 'visited' is fine.
-                    # We are doing DFS, so stack structure is correct.
-                    new_path = path + [next_id]
-                    stack.append((next_id, new_path))
-                    
-        except Task.DoesNotExist:
-            continue
+        # Read the edges from the shared snapshot instead of issuing one query
+        # per visited task. Unknown ids simply have no outgoing edges.
+        for next_id in graph.dependencies_of(current_id):
+            if next_id not in visited: # Optimization: don't revisit nodes in this search
+                # However, strictly for finding *any* path to source, strict 'visited' is fine.
+                # We are doing DFS, so stack structure is correct.
+                new_path = path + [next_id]
+                stack.append((next_id, new_path))
 
-    return False, []
+    return None
+
+def _edges_exist(path, project_id):
+    """True if every edge along `path` is still in the database."""
+    needed = set(zip(path, path[1:]))
+    task_ids = list({task_id for task_id, _ in needed})
+    found = set()
+    for start in range(0, len(task_ids), REMOVAL_CHUNK_SIZE):
+        found.update(
+            TaskDependency.objects
+            .filter(project_id=project_id, task_id__in=task_ids[start:start + REMOVAL_CHUNK_SIZE])
+            .values_list('task_id', 'depends_on_id')
+        )
+    return needed <= found
 
-def update_task_status(task):
+def update_task_status(task, lost_dependencies=False):
     """
     Evaluates and updates the task's status based on the status of its dependencies.
 
@@ -65,25 +91,36 @@ def update_task_status(task):
     - If ANY dependency is 'blocked' -> Task becomes 'blocked'.
     - If ALL dependencies are 'completed' -> Task becomes 'in_progress' (Ready).
     - If dependencies exist but not all are completed -> Task becomes 'pending'.
+    - Dependencies on archived tasks count as 'completed'.
+    - If the task just lost its last dependency -> Task becomes 'in_progress' (Ready),
+      unless it is already completed.
     
     Args:
         task (Task): The task instance to evaluate.
+        lost_dependencies (bool): True if dependencies of the task were just removed.
         
     Returns:
         bool: True if the status was changed, False otherwise.
     """
-    dependencies = task.dependencies.all()
+    # One query for the statuses of all live prerequisites.
+    dependency_statuses = list(task.dependencies.values_list('depends_on__status', flat=True))
     
-    if not dependencies.exists():
+    # Archived prerequisites are always completed, so they only matter for
+    # deciding whether the task has any dependencies at all.
+    if not dependency_statuses and not ArchivedTaskDependency.objects.filter(task_id=task.id).exists():
         # If no dependencies, we don't automatically change status based on them.
-        # It's up to manual update or default state.
-        return False
+        # It's up to manual update or default state. The exception is a task that
+        # just lost its last prerequisite: nothing is holding it back any more.
+        if not lost_dependencies or task.status in ('completed', 'in_progress'):
+            return False
+        task.status = 'in_progress'
+        task.save()
+        return True
         
     blocked_exists = False
     all_completed = True
     
-    for dep in dependencies:
-        dep_status = dep.depends_on.status
+    for dep_status in dependency_statuses:
         if dep_status == 'blocked':
             blocked_exists = True
         if dep_status != 'completed':
@@ -129,3 +166,123 @@ def trigger_dependent_updates(task):
         
         if status_changed:
             trigger_dependent_updates(dependent_task)
+
+def remove_dependencies(pairs):
+    """
+    Removes dependencies and re-derives the status of the tasks that lost them.
+
+    Only the affected tasks are re-evaluated, and propagation continues
+    downstream only as far as statuses actually change. The shared graph
+    snapshot is patched in place rather than rebuilt.
+
+    Args:
+        pairs (list[tuple[int, int]]): (task_id, depends_on_id) edges to remove.
+            Edges that do not exist are ignored.
+
+    Returns:
+        int: The number of dependencies removed.
+    """
+    if not pairs:
+        return 0
+
+    depends_on_by_task = defaultdict(set)
+    for task_id, depends_on_id in pairs:
+        depends_on_by_task[task_id].add(depends_on_id)
+    groups = list(depends_on_by_task.items())
+
+    with transaction.atomic():
+        # One OR'd term per task and a bounded number of terms per query: a
+        # single OR over every pair exceeds SQLite's expression depth limit.
+        edges = []
+        for start in range(0, len(groups), REMOVAL_CHUNK_SIZE):
+            edge_filter = Q()
+            for task_id, depends_on_ids in groups[start:start + REMOVAL_CHUNK_SIZE]:
+                edge_filter |= Q(task_id=task_id, depends_on_id__in=depends_on_ids)
+            edges.extend(TaskDependency.objects.filter(edge_filter))
+        if not edges:
+            return 0
+        with snapshot_updates_suspended():
+            TaskDependency.objects.filter(id__in=[edge.id for edge in edges]).delete()
+        _record_removed_edges(edges)
+
+        affected_ids = {edge.task_id for edge in edges}
+        for task in Task.objects.filter(id__in=affected_ids):
+            if update_task_status(task, lost_dependencies=True):
+                trigger_dependent_updates(task)
+
+    return len(edges)
+
+def _record_removed_edges(edges):
+    by_project = defaultdict(list)
+    for edge in edges:
+        by_project[edge.project_id].append((edge.task_id, edge.depends_on_id))
+    for project_id, pairs in by_project.items():
+        record_removed_edges(pairs, project_id)
+
+def archive_completed_tasks(batch_size=500, project=None):
+    """
+    Moves completed tasks out of the live tables into the archive tables.
+
+    A task is archived once it is completed and nothing that is still open
+    (pending, in progress or blocked) depends on it. Work is done in batches,
+    each in its own transaction, so the live tables are never locked for long.
+    Every dependency touching an archived task is copied to
+    ArchivedTaskDependency, which is how `update_task_status` keeps counting
+    archived prerequisites as completed.
+
+    Args:
+        batch_size (int): Maximum number of tasks moved per transaction.
+        project (Project | None): Only archive this project's tasks.
+
+    Returns:
+        int: The number of tasks archived.
+    """
+    open_dependents = TaskDependency.objects.filter(
+        depends_on=OuterRef('pk'),
+    ).exclude(task__status='completed')
+    candidates = Task.objects.all()
+    if project is not None:
+        candidates = candidates.filter(project=project)
+    candidates = (
+        candidates
+        .filter(status='completed')
+        .exclude(Exists(open_dependents))
+        .order_by('id')
+    )
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(candidates.select_for_update()[:batch_size])
+            if not batch:
+                return archived
+            ids = [task.id for task in batch]
+
+            ArchivedTask.objects.bulk_create([
+                ArchivedTask(
+                    id=task.id,
+                    project_id=task.project_id,
+                    title=task.title,
+                    description=task.description,
+                    status=task.status,
+                    created_at=task.created_at,
+                    updated_at=task.updated_at,
+                )
+                for task in batch
+            ])
+            edges = list(TaskDependency.objects.filter(Q(task_id__in=ids) | Q(depends_on_id__in=ids)))
+            ArchivedTaskDependency.objects.bulk_create([
+                ArchivedTaskDependency(
+                    task_id=edge.task_id,
+                    depends_on_id=edge.depends_on_id,
+                    created_at=edge.created_at,
+                )
+                for edge in edges
+            ])
+            # Cascades to the live TaskDependency rows copied above, which are
+            # then recorded once per project rather than per row.
+            with snapshot_updates_suspended():
+                Task.objects.filter(id__in=ids).delete()
+            _record_removed_edges(edges)
+
+        archived += len(batch)
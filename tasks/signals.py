@@ -0,0 +1,41 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import TaskDependency
+from .snapshot import record_removed_edges
+
+_state = threading.local()
+
+
+@contextmanager
+def snapshot_updates_suspended():
+    """
+    Skips the per-row snapshot bookkeeping below for bulk writes in this thread.
+
+    The caller must call `record_removed_edges()` once for every project it
+    touched instead.
+    """
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def _suspended():
+    return getattr(_state, 'suspended', False)
+
+
+# Adding tasks or edges needs no bookkeeping: a task missing from the snapshot
+# simply has no edges yet, and edges added since the snapshot was built are
+# read on top of it (see `tasks.snapshot.load_graph`).
+
+@receiver(post_delete, sender=TaskDependency)
+def dependency_removed(sender, instance, **kwargs):
+    if _suspended():
+        return
+    record_removed_edges([(instance.task_id, instance.depends_on_id)], instance.project_id)
@@ -0,0 +1,360 @@
+"""
+Memory-mapped snapshot of the dependency graph, shared by every worker on a host.
+
+Instead of each gunicorn worker rebuilding its own graph index from the database,
+one worker writes a compact binary file and all of them map it read-only. The
+pages live once in the OS page cache, so per-worker memory does not grow with the
+size of the graph and a freshly booted worker only pays for an mmap() call.
+
+File layout (native byte order):
+
+    header    magic (4s), format (I), generation (q), version (q),
+              max_edge_id (q), node_count (q), edge_count (q)
+    node_ids  int64[node_count]      ids of the tasks that have edges, sorted
+    indptr    int64[node_count + 1]  CSR row offsets into `indices`
+    indices   int64[edge_count]      row of each depends_on task, -1 if removed
+
+There is one snapshot per project (tasks without a project share their own),
+so graph work for one board never touches another board's graph.
+
+The database is the authority on whether a snapshot can be trusted: the
+header records the project's `GraphVersion` (generation and version) and the
+highest edge id the snapshot was built from. A snapshot from another
+generation, or from a later version than the database holds (e.g. after a
+restore), is rebuilt. Otherwise it is used as is, and the edges added since
+(ids above `max_edge_id`, whoever wrote them) are read on top of it with one
+indexed query; see `load_graph()`. Removed edges are tombstoned in place after
+commit; a removal this host never saw can only make a snapshot report a cycle
+that no longer exists, so callers confirm cycles against the database.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import GraphVersion, TaskDependency
+
+MAGIC = b'TGS1'
+FORMAT_VERSION = 3
+HEADER = struct.Struct('=4sIqqqqq')
+
+# Edges read on top of a snapshot before it is worth rebuilding.
+OVERLAY_LIMIT = 1000
+
+# Per-process cache of mapped snapshots, keyed by file path.
+_snapshots = {}
+
+
+def snapshot_dir():
+    return getattr(
+        settings,
+        'TASK_GRAPH_SNAPSHOT_DIR',
+        os.path.join(tempfile.gettempdir(), 'task_graph_snapshots'),
+    )
+
+
+def snapshot_path(project_id=None):
+    """
+    Returns the snapshot file for a project in the current database.
+
+    The database name is part of the file name so that, e.g., the test database
+    and the development database never share a snapshot.
+    """
+    db = connection.settings_dict
+    key = f"{db.get('HOST', '')}:{db.get('PORT', '')}:{db['NAME']}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    partition = 'none' if project_id is None else project_id
+    return os.path.join(snapshot_dir(), f'graph-{digest}-p{partition}.bin')
+
+
+@contextmanager
+def _locked(path):
+    """Serializes snapshot rebuilds and in-place patches across processes."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class GraphSnapshot:
+    """
+    Zero-copy view over a snapshot file.
+
+    All arrays are memoryviews into the mapping, so nothing proportional to the
+    graph size is copied into the worker's heap.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        with open(path, 'r+b' if writable else 'rb') as snapshot_file:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=access)
+            self.inode = os.fstat(snapshot_file.fileno()).st_ino
+
+        (magic, fmt, self.generation, self.version, self.max_edge_id,
+         node_count, edge_count) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Unsupported graph snapshot: {path}")
+
+        buf = memoryview(self._mmap)
+        offset = HEADER.size
+        self.node_ids = buf[offset:offset + 8 * node_count].cast('q')
+        offset += 8 * node_count
+        self.indptr = buf[offset:offset + 8 * (node_count + 1)].cast('q')
+        offset += 8 * (node_count + 1)
+        self.indices = buf[offset:offset + 8 * edge_count].cast('q')
+        buf.release()
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def index_of(self, task_id):
+        """Returns the row of `task_id`, or None if the task is not in the snapshot."""
+        i = bisect_left(self.node_ids, task_id)
+        if i < len(self.node_ids) and self.node_ids[i] == task_id:
+            return i
+        return None
+
+    def dependencies_of(self, task_id):
+        """Returns the ids of the tasks that `task_id` depends on."""
+        i = self.index_of(task_id)
+        if i is None:
+            return []
+        node_ids = self.node_ids
+        return [
+            node_ids[j]
+            for j in self.indices[self.indptr[i]:self.indptr[i + 1]]
+            if j >= 0
+        ]
+
+    def close(self):
+        for view in (self.node_ids, self.indptr, self.indices):
+            view.release()
+        self._mmap.close()
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _open(path):
+    try:
+        return GraphSnapshot(path)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _trusted(snapshot, generation, version):
+    return snapshot is not None and snapshot.generation == generation and snapshot.version <= version
+
+
+def build_snapshot(project_id=None, replacing=None, force=False):
+    """
+    Writes a fresh snapshot of one project's graph and returns it mapped.
+
+    Rebuilds are serialized across processes. If another worker has already
+    replaced `replacing` (the caller's outdated mapping) with a file that can be
+    trusted, that file is used instead of writing yet another one; `force`
+    always writes.
+
+    The version is read *before* the edges, so a write that lands meanwhile
+    is either in the snapshot or above its `max_edge_id`.
+    """
+    path = snapshot_path(project_id)
+    with _locked(path):
+        generation, version = GraphVersion.current(project_id)
+        if not force:
+            current = _open(path)
+            if _trusted(current, generation, version) and (replacing is None or current.inode != replacing.inode):
+                _snapshots[path] = current
+                return current
+
+        edge_ids = array('q')
+        task_ids = array('q')
+        depends_on_ids = array('q')
+        edges = (
+            TaskDependency.objects
+            .filter(project_id=project_id)
+            .order_by('task_id', 'id')
+            .values_list('id', 'task_id', 'depends_on_id')
+        )
+        for edge_id, task_id, depends_on_id in edges.iterator():
+            edge_ids.append(edge_id)
+            task_ids.append(task_id)
+            depends_on_ids.append(depends_on_id)
+
+        # Edges are grouped by the dependent task; rows follow node_ids order.
+        node_ids = array('q', sorted(set(task_ids) | set(depends_on_ids)))
+        rows = {task_id: i for i, task_id in enumerate(node_ids)}
+        indptr = array('q', [0] * (len(node_ids) + 1))
+        indices = array('q', (rows[depends_on_id] for depends_on_id in depends_on_ids))
+        for task_id in task_ids:
+            indptr[rows[task_id] + 1] += 1
+        for i in range(len(node_ids)):
+            indptr[i + 1] += indptr[i]
+
+        header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, generation, version, max(edge_ids, default=0),
+            len(node_ids), len(indices),
+        )
+        _write_atomic(path, b''.join([
+            header,
+            node_ids.tobytes(),
+            indptr.tobytes(),
+            indices.tobytes(),
+        ]))
+        snapshot = GraphSnapshot(path)
+    _snapshots[path] = snapshot
+    return snapshot
+
+
+def get_snapshot(project_id=None):
+    """
+    Returns the mapped snapshot of a project's graph, rebuilding it if it cannot be trusted.
+
+    It may lag behind the database by the edges added since it was built;
+    `load_graph()` adds those. Mappings are cached per process and follow the
+    file when another worker replaces it; a replaced mapping gets unmapped once
+    nothing refers to it any more.
+    """
+    path = snapshot_path(project_id)
+    generation, version = GraphVersion.current(project_id)
+    snapshot = _snapshots.get(path)
+    if snapshot is None or snapshot.inode != _inode(path):
+        snapshot = _open(path)
+    if not _trusted(snapshot, generation, version):
+        return build_snapshot(project_id, replacing=snapshot)
+    _snapshots[path] = snapshot
+    return snapshot
+
+
+def _added_edges(snapshot, project_id, limit=None):
+    edges = (
+        TaskDependency.objects
+        .filter(project_id=project_id, id__gt=snapshot.max_edge_id)
+        .order_by('id')
+        .values_list('task_id', 'depends_on_id')
+    )
+    return list(edges[:limit] if limit else edges)
+
+
+class Graph:
+    """A snapshot plus the edges added to the database since it was built."""
+
+    def __init__(self, snapshot, added_edges):
+        self.snapshot = snapshot
+        self.added = defaultdict(list)
+        for task_id, depends_on_id in added_edges:
+            self.added[task_id].append(depends_on_id)
+
+    def dependencies_of(self, task_id):
+        """Returns the ids of the tasks that `task_id` depends on."""
+        dependencies = self.snapshot.dependencies_of(task_id)
+        if task_id in self.added:
+            dependencies += self.added[task_id]
+        return dependencies
+
+
+def load_graph(project_id=None, rebuild=False):
+    """
+    Returns a project's current graph: the shared snapshot plus the edges added since.
+
+    Costs two indexed queries. Once more than `OVERLAY_LIMIT` edges have piled
+    up on top of the snapshot it is rebuilt; `rebuild` forces that, e.g. when
+    the snapshot turned out to still hold a removed edge.
+    """
+    if rebuild:
+        snapshot = build_snapshot(project_id, force=True)
+    else:
+        snapshot = get_snapshot(project_id)
+        added_edges = _added_edges(snapshot, project_id, limit=OVERLAY_LIMIT + 1)
+        if len(added_edges) <= OVERLAY_LIMIT:
+            return Graph(snapshot, added_edges)
+        snapshot = build_snapshot(project_id, replacing=snapshot)
+    return Graph(snapshot, _added_edges(snapshot, project_id))
+
+
+@contextmanager
+def _patching(project_id):
+    """
+    Yields the project's snapshot mapped writable, or None if there is none yet.
+
+    Every worker maps the same file, so changes written through this mapping are
+    visible to all of them without a rebuild. Patches run after commit, so the
+    snapshot never reflects a write that was rolled back.
+    """
+    path = snapshot_path(project_id)
+    with _locked(path):
+        try:
+            snapshot = GraphSnapshot(path, writable=True)
+        except (FileNotFoundError, ValueError):
+            snapshot = None
+        try:
+            yield snapshot
+        finally:
+            if snapshot is not None:
+                snapshot.close()
+
+
+def patch_remove_edges(edges, project_id=None):
+    """
+    Drops edges from the snapshot file in place by tombstoning their slots.
+
+    Removing an edge never needs more room in the CSR arrays, so it does not
+    force a rebuild.
+    """
+    with _patching(project_id) as snapshot:
+        if snapshot is None:
+            return
+        indices = snapshot.indices
+        for task_id, depends_on_id in edges:
+            i = snapshot.index_of(task_id)
+            j = snapshot.index_of(depends_on_id)
+            if i is None or j is None:
+                continue
+            for k in range(snapshot.indptr[i], snapshot.indptr[i + 1]):
+                if indices[k] == j:
+                    indices[k] = -1
+                    break
+
+
+def record_removed_edges(edges, project_id=None):
+    """
+    Bookkeeping for edges removed from a project, inside the removing transaction.
+
+    Bumps the project's graph version and tombstones the edges in the shared
+    snapshot once the removal is committed. Until then the snapshot still has
+    the edges, which can only make cycle detection more conservative.
+    """
+    GraphVersion.bump(project_id)
+    edges = list(edges)
+    transaction.on_commit(lambda: patch_remove_edges(edges, project_id))
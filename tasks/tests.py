@@ -1,8 +1,38 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Task, TaskDependency
-from .services import update_task_status
+from .models import ArchivedTask, ArchivedTaskDependency, GraphVersion, Project, Task, TaskDependency
+from .profiling import list_profiles
+from .rendering import dumps, task_rows
+from .serializers import TaskSerializer
+from .services import archive_completed_tasks, detect_cycle, remove_dependencies, update_task_status
+from .snapshot import GraphSnapshot, build_snapshot, get_snapshot, load_graph, patch_remove_edges, snapshot_path
+
+_snapshot_dir_override = None
+
+def setUpModule():
+    # Every test writes graph snapshots; keep them in a directory of this run's own.
+    global _snapshot_dir_override
+    _snapshot_dir_override = override_settings(TASK_GRAPH_SNAPSHOT_DIR=tempfile.mkdtemp())
+    _snapshot_dir_override.enable()
+
+def tearDownModule():
+    _snapshot_dir_override.disable()
+    shutil.rmtree(_snapshot_dir_override.options['TASK_GRAPH_SNAPSHOT_DIR'], ignore_errors=True)
 
 class TaskDependencyViewTests(TestCase):
     def setUp(self):
@@ -116,3 +146,426 @@ class TaskStatusUpdateTests(TestCase):
         # Check A (should be blocked because B is blocked)
         self.task_a.refresh_from_db()
         self.assertEqual(self.task_a.status, 'blocked')
+
+class GraphSnapshotTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.task_a = Task.objects.create(title="Task A")
+        self.task_b = Task.objects.create(title="Task B")
+        self.task_c = Task.objects.create(title="Task C")
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_b)
+
+    def test_snapshot_matches_database(self):
+        snapshot = build_snapshot(force=True)
+        # Only tasks with edges are stored
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(snapshot.dependencies_of(self.task_a.id), [self.task_b.id])
+        self.assertEqual(snapshot.dependencies_of(self.task_b.id), [])
+
+    def test_new_dependency_read_on_top_of_snapshot(self):
+        snapshot = get_snapshot()
+        Task.objects.create(title="Task D")
+        TaskDependency.objects.create(task=self.task_b, depends_on=self.task_c)
+        self.assertIs(get_snapshot(), snapshot)
+        self.assertEqual(load_graph().dependencies_of(self.task_b.id), [self.task_c.id])
+
+        # C -> A now closes A -> B -> C
+        url = f'/api/tasks/{self.task_c.id}/dependencies/'
+        response = self.client.post(url, {'depends_on_id': self.task_a.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_edges_written_without_signals_are_seen(self):
+        get_snapshot()
+        TaskDependency.objects.bulk_create([TaskDependency(task=self.task_b, depends_on=self.task_c)])
+        is_circular, path = detect_cycle(self.task_c.id, self.task_a.id)
+        self.assertTrue(is_circular)
+        self.assertEqual(path, [self.task_c.id, self.task_a.id, self.task_b.id, self.task_c.id])
+
+    def test_edge_added_on_another_host_is_seen(self):
+        # Each snapshot directory stands for one host sharing the database.
+        with tempfile.TemporaryDirectory() as first_host, tempfile.TemporaryDirectory() as second_host:
+            with override_settings(TASK_GRAPH_SNAPSHOT_DIR=first_host):
+                get_snapshot()
+            with override_settings(TASK_GRAPH_SNAPSHOT_DIR=second_host):
+                url = f'/api/tasks/{self.task_b.id}/dependencies/'
+                response = self.client.post(url, {'depends_on_id': self.task_c.id}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            with override_settings(TASK_GRAPH_SNAPSHOT_DIR=first_host):
+                url = f'/api/tasks/{self.task_c.id}/dependencies/'
+                response = self.client.post(url, {'depends_on_id': self.task_a.id}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_edge_removed_on_another_host_is_not_a_cycle(self):
+        with tempfile.TemporaryDirectory() as first_host, tempfile.TemporaryDirectory() as second_host:
+            with override_settings(TASK_GRAPH_SNAPSHOT_DIR=first_host):
+                stale = get_snapshot()
+            with override_settings(TASK_GRAPH_SNAPSHOT_DIR=second_host):
+                with self.captureOnCommitCallbacks(execute=True):
+                    remove_dependencies([(self.task_a.id, self.task_b.id)])
+            with override_settings(TASK_GRAPH_SNAPSHOT_DIR=first_host):
+                self.assertEqual(stale.dependencies_of(self.task_a.id), [self.task_b.id])
+                url = f'/api/tasks/{self.task_b.id}/dependencies/'
+                response = self.client.post(url, {'depends_on_id': self.task_a.id}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(get_snapshot().dependencies_of(self.task_a.id), [])
+
+    def test_snapshot_rebuilt_when_database_version_goes_back(self):
+        # e.g. the database was restored from a backup
+        snapshot = get_snapshot()
+        GraphVersion.objects.update(version=-1)
+        self.assertIsNot(get_snapshot(), snapshot)
+
+    def test_snapshot_rebuilt_once_overlay_is_full(self):
+        snapshot = build_snapshot(force=True)
+        with mock.patch('tasks.snapshot.OVERLAY_LIMIT', 1):
+            TaskDependency.objects.create(task=self.task_b, depends_on=self.task_c)
+            self.assertIs(load_graph().snapshot, snapshot)
+            TaskDependency.objects.create(task=self.task_a, depends_on=self.task_c)
+            graph = load_graph()
+        self.assertIsNot(graph.snapshot, snapshot)
+        self.assertEqual(graph.added, {})
+        self.assertEqual(graph.dependencies_of(self.task_a.id), [self.task_b.id, self.task_c.id])
+
+    def test_status_change_keeps_snapshot(self):
+        snapshot = get_snapshot()
+        url = f'/api/tasks/{self.task_c.id}/'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.patch(url, {'status': 'completed'}, format='json')
+        self.assertEqual(callbacks, [])
+        self.assertIs(get_snapshot(), snapshot)
+
+    def test_concurrent_rebuild_keeps_mappings_in_sync(self):
+        # Two workers map the same snapshot; a late rebuild by the second one
+        # must not leave the first mapping an orphaned inode.
+        first = get_snapshot()
+        build_snapshot()
+        second = GraphSnapshot(snapshot_path())
+        self.addCleanup(second.close)
+
+        patch_remove_edges([(self.task_a.id, self.task_b.id)])
+        self.assertEqual(first.dependencies_of(self.task_a.id), [])
+        self.assertEqual(second.dependencies_of(self.task_a.id), [])
+
+    def test_add_dependency_does_not_query_per_visited_task(self):
+        chain = [Task.objects.create(title=f"Chain {i}") for i in range(30)]
+        for task, depends_on in zip(chain, chain[1:]):
+            TaskDependency.objects.create(task=task, depends_on=depends_on)
+        get_snapshot()
+
+        # The cycle check walks the whole chain looking for task A
+        url = f'/api/tasks/{self.task_a.id}/dependencies/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'depends_on_id': chain[0].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertLess(len(queries), 10)
+
+        with self.assertRaises(ValidationError):
+            TaskDependency(task=chain[-1], depends_on=chain[0]).save()
+
+    def test_forced_rebuild_reloads_existing_mappings(self):
+        first = get_snapshot()
+        build_snapshot(force=True)
+        self.assertIsNot(get_snapshot(), first)
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # A -> B -> C, with B and C completed
+        self.task_a = Task.objects.create(title="Task A", status='pending')
+        self.task_b = Task.objects.create(title="Task B", status='completed')
+        self.task_c = Task.objects.create(title="Task C", status='completed')
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_b)
+        TaskDependency.objects.create(task=self.task_b, depends_on=self.task_c)
+
+    def test_archives_only_tasks_without_open_dependents(self):
+        self.assertEqual(archive_completed_tasks(batch_size=1), 1)
+
+        # B stays live because A is still pending
+        self.assertFalse(Task.objects.filter(id=self.task_c.id).exists())
+        self.assertTrue(Task.objects.filter(id=self.task_b.id).exists())
+        self.assertTrue(ArchivedTask.objects.filter(id=self.task_c.id).exists())
+        self.assertTrue(ArchivedTaskDependency.objects.filter(
+            task_id=self.task_b.id, depends_on_id=self.task_c.id,
+        ).exists())
+
+    def test_archive_records_removed_edges_once_per_batch(self):
+        for i in range(10):
+            Task.objects.create(title=f"Done {i}", status='completed')
+
+        with mock.patch('tasks.services.record_removed_edges') as recorded, \
+                mock.patch('tasks.signals.record_removed_edges') as recorded_per_row:
+            self.assertEqual(archive_completed_tasks(), 11)
+
+        recorded.assert_called_once_with([(self.task_b.id, self.task_c.id)], None)
+        recorded_per_row.assert_not_called()
+
+    def test_archived_dependency_counts_as_completed(self):
+        archive_completed_tasks()
+        self.task_b.status = 'pending'
+        self.task_b.save()
+
+        self.assertTrue(update_task_status(self.task_b))
+        self.assertEqual(self.task_b.status, 'in_progress')
+
+    def test_archive_listing_fetches_dependencies_in_one_query(self):
+        self.task_a.status = 'completed'
+        self.task_a.save()
+        archive_completed_tasks()
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/archive/tasks/')
+        dependencies = {task['id']: task['dependencies'] for task in response.json()}
+        self.assertEqual(dependencies, {
+            self.task_a.id: [self.task_b.id],
+            self.task_b.id: [self.task_c.id],
+            self.task_c.id: [],
+        })
+
+    def test_status_evaluation_is_one_query(self):
+        # A depends on live, completed B only; the archive table is not consulted
+        self.task_a.status = 'in_progress'
+        with self.assertNumQueries(1):
+            self.assertFalse(update_task_status(self.task_a))
+
+    def test_archive_endpoint_is_read_only(self):
+        archive_completed_tasks()
+        response = self.client.get('/api/archive/tasks/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['id'] for task in response.json()], [self.task_c.id])
+
+        response = self.client.delete(f'/api/archive/tasks/{self.task_c.id}/')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+class ProjectPartitionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alpha = Project.objects.create(name="Alpha")
+        self.beta = Project.objects.create(name="Beta")
+        self.task_a = Task.objects.create(title="Task A", project=self.alpha)
+        self.task_b = Task.objects.create(title="Task B", project=self.alpha)
+        self.task_x = Task.objects.create(title="Task X", project=self.beta)
+
+    def test_cross_project_dependency_rejected(self):
+        url = f'/api/tasks/{self.task_a.id}/dependencies/'
+        response = self.client.post(url, {'depends_on_id': self.task_x.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error'], 'Cross-project dependency not allowed')
+        self.assertFalse(TaskDependency.objects.exists())
+
+    def test_dependency_inherits_project(self):
+        url = f'/api/tasks/{self.task_a.id}/dependencies/'
+        response = self.client.post(url, {'depends_on_id': self.task_b.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(TaskDependency.objects.get().project, self.alpha)
+
+    def test_listing_and_snapshot_scoped_to_project(self):
+        response = self.client.get(f'/api/tasks/?project={self.beta.id}')
+        self.assertEqual([task['id'] for task in response.json()], [self.task_x.id])
+
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_b)
+        self.assertEqual(len(build_snapshot(self.alpha.id, force=True)), 2)
+        self.assertEqual(len(build_snapshot(self.beta.id, force=True)), 0)
+
+    def test_invalid_project_filter_rejected(self):
+        for url in ('/api/tasks/?project=abc', '/api/archive/tasks/?project=abc'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('project', response.json())
+
+        Task.objects.create(title="Unassigned")
+        response = self.client.get('/api/tasks/?project=')
+        self.assertEqual([task['title'] for task in response.json()], ["Unassigned"])
+
+    def test_cannot_move_linked_task_to_other_project(self):
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_b)
+        url = f'/api/tasks/{self.task_a.id}/'
+        response = self.client.patch(url, {'project': self.beta.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class DependencyRemovalTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # C -> A -> B, with B blocked
+        self.task_a = Task.objects.create(title="Task A", status='blocked')
+        self.task_b = Task.objects.create(title="Task B", status='blocked')
+        self.task_c = Task.objects.create(title="Task C", status='blocked')
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_b)
+        TaskDependency.objects.create(task=self.task_c, depends_on=self.task_a)
+
+    def test_remove_single_dependency_propagates(self):
+        url = f'/api/tasks/{self.task_a.id}/dependencies/{self.task_b.id}/'
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(TaskDependency.objects.filter(task=self.task_a, depends_on=self.task_b).exists())
+
+        # A lost its only prerequisite; C now waits on an unfinished A
+        self.task_a.refresh_from_db()
+        self.task_c.refresh_from_db()
+        self.assertEqual(self.task_a.status, 'in_progress')
+        self.assertEqual(self.task_c.status, 'pending')
+
+    def test_remove_missing_dependency_returns_404(self):
+        url = f'/api/tasks/{self.task_b.id}/dependencies/{self.task_a.id}/'
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_remove(self):
+        task_d = Task.objects.create(title="Task D", status='completed')
+        TaskDependency.objects.create(task=self.task_a, depends_on=task_d)
+
+        response = self.client.post('/api/dependencies/bulk-remove/', {'dependencies': [
+            {'task_id': self.task_a.id, 'depends_on_id': self.task_b.id},
+            {'task_id': self.task_b.id, 'depends_on_id': self.task_c.id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['removed'], 1)
+
+        # A's remaining prerequisite (D) is completed
+        self.task_a.refresh_from_db()
+        self.assertEqual(self.task_a.status, 'in_progress')
+
+    def test_bulk_remove_many_pairs(self):
+        # Far more pairs than SQLite's expression depth limit allows in one OR
+        pairs = [(self.task_a.id, self.task_b.id)] + [(10_000 + i, 20_000 + i) for i in range(1500)]
+        self.assertEqual(remove_dependencies(pairs), 1)
+
+        dependencies = [{'task_id': 10_000 + i, 'depends_on_id': 20_000 + i} for i in range(1000)]
+        response = self.client.post('/api/dependencies/bulk-remove/', {'dependencies': dependencies}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        dependencies.append({'task_id': self.task_c.id, 'depends_on_id': self.task_a.id})
+        response = self.client.post('/api/dependencies/bulk-remove/', {'dependencies': dependencies}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(TaskDependency.objects.filter(task=self.task_c, depends_on=self.task_a).exists())
+
+    def test_snapshot_patched_without_rebuild(self):
+        snapshot = get_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_dependencies([(self.task_a.id, self.task_b.id)])
+
+        self.assertIs(get_snapshot(), snapshot)
+        self.assertEqual(snapshot.dependencies_of(self.task_a.id), [])
+
+        # B -> C is no longer circular
+        url = f'/api/tasks/{self.task_b.id}/dependencies/'
+        response = self.client.post(url, {'depends_on_id': self.task_c.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+@override_settings(TASK_PROFILING_TOKEN='secret', TASK_PROFILING_SAMPLE_RATE=0.0, TASK_PROFILING_MAX_FILES=2)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        self.settings_override = override_settings(TASK_PROFILING_DIR=self.profile_dir)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client = APIClient()
+        Task.objects.create(title="Task A")
+
+    def test_profiles_only_with_valid_header(self):
+        self.client.get('/api/tasks/')
+        self.client.get('/api/tasks/', HTTP_X_PROFILE='wrong')
+        self.assertEqual(list_profiles(), [])
+
+        self.client.get('/api/tasks/', HTTP_X_PROFILE='secret')
+        profiles = list_profiles()
+        self.assertEqual(len(profiles), 1)
+        with open(profiles[0][:-len('.prof')] + '.json') as meta_file:
+            meta = json.load(meta_file)
+        self.assertEqual(meta['endpoint'], 'task-list')
+        self.assertEqual(meta['graph_size'], 1)
+        self.assertGreater(meta['query_count'], 0)
+
+    def test_non_ascii_header_does_not_match(self):
+        for header in ('café', 'secret\u2603'):
+            response = self.client.get('/api/tasks/', HTTP_X_PROFILE=header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list_profiles(), [])
+
+    def test_failed_capture_does_not_fail_request(self):
+        # A regular file where the profile directory should be
+        not_a_dir = os.path.join(self.profile_dir, 'not-a-dir')
+        open(not_a_dir, 'w').close()
+        with override_settings(TASK_PROFILING_DIR=not_a_dir), self.assertLogs('tasks.profiling', 'ERROR'):
+            response = self.client.get('/api/tasks/', HTTP_X_PROFILE='secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with mock.patch('tasks.profiling.graph_size', side_effect=RuntimeError), self.assertLogs('tasks.profiling', 'ERROR'):
+            response = self.client.get('/api/tasks/', HTTP_X_PROFILE='secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list_profiles(), [])
+
+    def test_rotation_and_summary(self):
+        for _ in range(3):
+            self.client.get('/api/tasks/', HTTP_X_PROFILE='secret')
+        self.assertEqual(len(list_profiles()), 2)
+
+        out = io.StringIO()
+        call_command('summarize_profiles', stdout=out)
+        self.assertIn('task-list', out.getvalue())
+        self.assertIn('function calls', out.getvalue())
+
+class FastTaskListingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        project = Project.objects.create(name="Alpha")
+        self.task_a = Task.objects.create(title="Task A", description="Ünïcode \u2028 line", project=project)
+        self.task_b = Task.objects.create(title="Task B", status='completed', project=project)
+        self.task_c = Task.objects.create(title="Task C", project=project)
+        # Created out of id order on purpose
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_c)
+        TaskDependency.objects.create(task=self.task_a, depends_on=self.task_b)
+
+    def serializer_bytes(self):
+        tasks = Task.objects.order_by('id')
+        return JSONRenderer().render(TaskSerializer(tasks, many=True).data)
+
+    def test_fast_path_matches_serializer(self):
+        expected = self.serializer_bytes()
+        self.assertEqual(dumps(task_rows(Task.objects.order_by('id'))), expected)
+
+        response = self.client.get('/api/tasks/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, expected)
+
+    def test_payload_is_unchanged(self):
+        Task.objects.update(
+            created_at=datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc),
+            updated_at=datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        )
+        a, b, c = self.task_a.id, self.task_b.id, self.task_c.id
+        project = self.task_a.project_id
+        dates = '"created_at":"2024-01-02T03:04:05.678000Z","updated_at":"2024-01-02T03:04:05Z"'
+        expected = (
+            f'[{{"id":{a},"dependencies":[{b},{c}],"title":"Task A","description":"Ünïcode \\u2028 line",'
+            f'"status":"pending",{dates},"project":{project}}},'
+            f'{{"id":{b},"dependencies":[],"title":"Task B","description":"",'
+            f'"status":"completed",{dates},"project":{project}}},'
+            f'{{"id":{c},"dependencies":[],"title":"Task C","description":"",'
+            f'"status":"pending",{dates},"project":{project}}}]'
+        ).encode()
+
+        self.assertEqual(self.serializer_bytes(), expected)
+        self.assertEqual(self.client.get('/api/tasks/').content, expected)
+
+    def test_gzip_negotiation(self):
+        response = self.client.get('/api/tasks/export/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(response.content), self.serializer_bytes())
+
+    def test_gzip_refused_by_q_value(self):
+        for header in ('gzip;q=0', 'deflate, gzip; q=0.0', 'br, *;q=0', ''):
+            response = self.client.get('/api/tasks/', HTTP_ACCEPT_ENCODING=header)
+            self.assertFalse(response.has_header('Content-Encoding'), header)
+            self.assertEqual(response.content, self.serializer_bytes())
+
+        for header in ('gzip;q=0.5', 'br, *'):
+            response = self.client.get('/api/tasks/', HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(response['Content-Encoding'], 'gzip', header)
+
+    def test_browsable_api_still_uses_serializer(self):
+        response = self.client.get('/api/tasks/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('text/html', response['Content-Type'])
@@ -1,8 +1,24 @@
 from django.urls import path
-from .views import TaskDependencyView, TaskDetailView, TaskListView
+from .views import (
+    ArchivedTaskDetailView,
+    ArchivedTaskListView,
+    BulkDependencyRemovalView,
+    ProjectListView,
+    TaskDependencyDetailView,
+    TaskDependencyView,
+    TaskDetailView,
+    TaskExportView,
+    TaskListView,
+)
 
 urlpatterns = [
+    path('api/projects/', ProjectListView.as_view(), name='project-list'),
     path('api/tasks/', TaskListView.as_view(), name='task-list'),
+    path('api/tasks/export/', TaskExportView.as_view(), name='task-export'),
     path('api/tasks/<int:task_id>/dependencies/', TaskDependencyView.as_view(), name='task-dependency'),
+    path('api/tasks/<int:task_id>/dependencies/<int:depends_on_id>/', TaskDependencyDetailView.as_view(), name='task-dependency-detail'),
+    path('api/dependencies/bulk-remove/', BulkDependencyRemovalView.as_view(), name='dependency-bulk-remove'),
     path('api/tasks/<int:task_id>/', TaskDetailView.as_view(), name='task-detail'),
+    path('api/archive/tasks/', ArchivedTaskListView.as_view(), name='archived-task-list'),
+    path('api/archive/tasks/<int:task_id>/', ArchivedTaskDetailView.as_view(), name='archived-task-detail'),
 ]
@@ -1,10 +1,26 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.shortcuts import get_object_or_404
-from .models import Task, TaskDependency
-from .serializers import TaskDependencySerializer, TaskSerializer
-from .services import detect_cycle, trigger_dependent_updates
+from .models import ArchivedTask, Project, Task, TaskDependency
+from .serializers import (
+    ArchivedTaskSerializer,
+    BulkDependencyRemovalSerializer,
+    ProjectSerializer,
+    TaskDependencySerializer,
+    TaskSerializer,
+    archived_dependency_ids,
+)
+from .rendering import accepts_fast_json, json_response, task_rows
+from .services import remove_dependencies, trigger_dependent_updates
+
+def circular_dependency_response(path):
+    return Response({
+        "error": "Circular dependency detected",
+        "path": path
+    }, status=status.HTTP_400_BAD_REQUEST)
 
 class TaskDependencyView(APIView):
     def post(self, request, task_id):
@@ -14,17 +30,20 @@ class TaskDependencyView(APIView):
         if serializer.is_valid():
             depends_on_id = serializer.validated_data['depends_on_id']
             depends_on_task = get_object_or_404(Task, id=depends_on_id)
-            
-            # Check for circular dependency
-            is_circular, path = detect_cycle(task.id, depends_on_task.id)
-            
-            if is_circular:
+
+            # Each project is its own graph; edges may not cross projects.
+            if task.project_id != depends_on_task.project_id:
                 return Response({
-                    "error": "Circular dependency detected",
-                    "path": path
+                    "error": "Cross-project dependency not allowed"
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            # A task depending on itself is the shortest cycle
+            if task.id == depends_on_task.id:
+                return circular_dependency_response([task.id, task.id])
+            
             try:
+                # Saving checks for a circular dependency while holding the
+                # project's graph lock (see TaskDependency.save).
                 TaskDependency.objects.create(task=task, depends_on=depends_on_task)
                 
                 # New dependency might affect the task's status immediately
@@ -33,14 +52,69 @@ class TaskDependencyView(APIView):
                 update_task_status(task)
                 
                 return Response({"status": "Dependency added"}, status=status.HTTP_201_CREATED)
+            except DjangoValidationError as e:
+                if e.code == 'circular':
+                    return circular_dependency_response(e.params['path'])
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                  return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
                  
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class TaskDependencyDetailView(APIView):
+    def delete(self, request, task_id, depends_on_id):
+        get_object_or_404(TaskDependency, task_id=task_id, depends_on_id=depends_on_id)
+        remove_dependencies([(task_id, depends_on_id)])
+        return Response({"status": "Dependency removed"}, status=status.HTTP_200_OK)
+
+class BulkDependencyRemovalView(APIView):
+    def post(self, request):
+        serializer = BulkDependencyRemovalSerializer(data=request.data)
+
+        if serializer.is_valid():
+            pairs = [
+                (dependency['task_id'], dependency['depends_on_id'])
+                for dependency in serializer.validated_data['dependencies']
+            ]
+            removed = remove_dependencies(pairs)
+            return Response({"status": "Dependencies removed", "removed": removed}, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+def scope_to_project(queryset, request):
+    """
+    Filters by the `?project=<id>` query parameter, if given.
+
+    An empty value selects the tasks that have no project.
+    """
+    project_id = request.query_params.get('project')
+    if project_id is None:
+        return queryset
+    try:
+        project_id = int(project_id) if project_id else None
+    except ValueError:
+        raise ValidationError({"project": ["A valid integer is required."]})
+    return queryset.filter(project_id=project_id)
+
+class ProjectListView(APIView):
+    def get(self, request):
+        projects = Project.objects.all()
+        serializer = ProjectSerializer(projects, many=True)
+        return Response(serializer.data)
+
+    def post(self, request):
+        serializer = ProjectSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 class TaskListView(APIView):
     def get(self, request):
-        tasks = Task.objects.all()
+        tasks = scope_to_project(Task.objects.order_by('id'), request)
+        # Plain JSON skips TaskSerializer; the browsable API still uses it.
+        if accepts_fast_json(request):
+            return json_response(request, task_rows(tasks))
         serializer = TaskSerializer(tasks, many=True)
         return Response(serializer.data)
 
@@ -51,6 +125,11 @@ class TaskListView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class TaskExportView(APIView):
+    def get(self, request):
+        tasks = scope_to_project(Task.objects.order_by('id'), request)
+        return json_response(request, task_rows(tasks), filename='tasks.json')
+
 class TaskDetailView(APIView):
     def patch(self, request, task_id):
         task = get_object_or_404(Task, id=task_id)
@@ -70,3 +149,17 @@ class TaskDetailView(APIView):
         task = get_object_or_404(Task, id=task_id)
         task.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ArchivedTaskListView(APIView):
+    """Read-only listing of tasks moved out of the live tables by the archive job."""
+    def get(self, request):
+        tasks = scope_to_project(ArchivedTask.objects.order_by('id'), request)
+        context = {'dependency_ids': archived_dependency_ids(tasks)}
+        serializer = ArchivedTaskSerializer(tasks, many=True, context=context)
+        return Response(serializer.data)
+
+class ArchivedTaskDetailView(APIView):
+    def get(self, request, task_id):
+        task = get_object_or_404(ArchivedTask, id=task_id)
+        serializer = ArchivedTaskSerializer(task)
+        return Response(serializer.data)